@@ -13,26 +13,35 @@ Features:
 - Auto-react & Auto-reply configurable by env
 - /help and !help
 - Owner admin: restart/shutdown
-- Flask heartbeat for host health checks (binds to PORT)
+- HTTP heartbeat (aiohttp, in-process) for host health checks (binds to PORT)
 - Robust logging & global exception handling
 """
 
 import os
 import sys
 import time
+import re
 import random
+import hashlib
+import json
 import asyncio
 import threading
 import logging
 import sqlite3
 import signal
+import functools
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from math import isqrt
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 
-from flask import Flask, jsonify
+from cachetools import TTLCache
+from aiohttp import web
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 
 # Optional HF import (install huggingface_hub if you want HF features)
 try:
@@ -40,14 +49,24 @@ try:
 except Exception:
     InferenceClient = None
 
+# Optional Aho-Corasick keyword matching (install pyahocorasick; falls back to a compiled regex)
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
 # --------------------
 # Basic config
 # --------------------
 MAX_RESPONSE_LENGTH = 1900
 HF_TIMEOUT_SECONDS = 25
-DEFAULT_FLASK_PORT = 5000
+HF_MAX_WORKERS = 4
+DEFAULT_HTTP_PORT = 5000
+XP_FLUSH_SECONDS = 15
+REMINDER_RETRY_SECONDS = 10
 DB_PATH = os.environ.get("BOT_DB_PATH", "chatterous.db")
 OWNER_ID = int(os.environ.get("BOT_OWNER_ID", "0"))
+SYNC_HASH_PATH = os.environ.get("BOT_SYNC_HASH_PATH", ".last_sync")
 
 # --------------------
 # Logging
@@ -73,6 +92,8 @@ if not HF_KEY:
 # --------------------
 hf_client = None
 HF_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
+# dedicated pool so slow HF calls can't starve the default executor used by DB helpers
+_hf_pool = ThreadPoolExecutor(max_workers=HF_MAX_WORKERS, thread_name_prefix="hf")
 if HF_KEY and InferenceClient:
     try:
         hf_client = InferenceClient(token=HF_KEY)
@@ -102,11 +123,11 @@ except RuntimeError:
 def _graceful_shutdown(signum, frame):
     logger.info("Signal %s received, shutting down...", signum)
     try:
-        if asyncio.get_event_loop().is_running():
-            asyncio.get_event_loop().stop()
-    except Exception:
-        pass
-    sys.exit(0)
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        sys.exit(0)
+    # go through bot.close() (flushes buffered XP) instead of exiting mid-loop
+    loop.call_soon_threadsafe(lambda: asyncio.ensure_future(bot.close()))
 
 signal.signal(signal.SIGTERM, _graceful_shutdown)
 signal.signal(signal.SIGINT, _graceful_shutdown)
@@ -116,14 +137,40 @@ signal.signal(signal.SIGINT, _graceful_shutdown)
 # --------------------
 Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
 
-def get_db_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+DB: Optional[sqlite3.Connection] = None
+_db_lock = threading.Lock()
+_rr_map = {}  # (guild_id, message_id, emoji) -> role_id, mirror of reaction_roles
+_welcome_cache = {}  # guild_id -> (welcome_channel, welcome_message), mirror of guild_config
+
+@contextmanager
+def db_cursor():
+    """Yield a cursor on the shared connection; the block runs as one transaction."""
+    with _db_lock:
+        c = DB.cursor()
+        c.execute("BEGIN")
+        try:
+            yield c
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        finally:
+            c.close()
+
+async def run_db(func, *args):
+    """Run a blocking DB helper in the default executor so the event loop keeps running."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
 
 def init_db():
-    conn = get_db_conn()
-    c = conn.cursor()
+    global DB
+    DB = sqlite3.connect(DB_PATH, timeout=10, check_same_thread=False, isolation_level=None)
+    DB.row_factory = sqlite3.Row
+    DB.execute("PRAGMA journal_mode=WAL")
+    DB.execute("PRAGMA synchronous=NORMAL")
+    DB.execute("PRAGMA temp_store=memory")
+    DB.execute("PRAGMA cache_size=-64000")
+    c = DB.cursor()
     # guild config
     c.execute("""
     CREATE TABLE IF NOT EXISTS guild_config (
@@ -173,8 +220,28 @@ def init_db():
         emoji TEXT,
         role_id INTEGER
     )""")
-    conn.commit()
-    conn.close()
+    # indexes for the hot lookups (reminders poll, reaction lookup, per-user infractions)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rem_at ON reminders(remind_at)")
+    # keep only the newest registration per (guild, message, emoji) so the unique index can be built;
+    # the pre-index lookup effectively served the oldest row, so this changes which role duplicates grant
+    c.execute("""
+    DELETE FROM reaction_roles WHERE id NOT IN (
+        SELECT MAX(id) FROM reaction_roles GROUP BY guild_id, message_id, emoji
+    )""")
+    if c.rowcount > 0:
+        logger.warning("Removed %d duplicate reaction_roles row(s); the newest registration per message/emoji now applies",
+                       c.rowcount)
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_rr_lookup ON reaction_roles(guild_id, message_id, emoji)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_inf_user ON infractions(guild_id, user_id)")
+    c.execute("SELECT guild_id, message_id, emoji, role_id FROM reaction_roles")
+    _rr_map.clear()
+    for row in c.fetchall():
+        _rr_map[(row["guild_id"], row["message_id"], row["emoji"])] = row["role_id"]
+    c.execute("SELECT guild_id, welcome_channel, welcome_message FROM guild_config")
+    _welcome_cache.clear()
+    for row in c.fetchall():
+        _welcome_cache[row["guild_id"]] = (row["welcome_channel"], row["welcome_message"])
+    c.close()
 
 init_db()
 
@@ -184,70 +251,130 @@ init_db()
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True  # required for join events, roles
-bot = commands.Bot(command_prefix="!", intents=intents)
+# no message cache (nothing reads past messages) and no member chunking at startup
+bot = commands.Bot(command_prefix="!", intents=intents, max_messages=None, chunk_guilds_at_startup=False)
 
 # --------------------
 # Small utilities (DB-backed)
 # --------------------
-def ensure_user(user_id: int):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("INSERT OR IGNORE INTO users(user_id, coins, xp, level, last_daily) VALUES (?, ?, ?, ?, ?)", (user_id, 0, 0, 0, 0))
-    conn.commit()
-    conn.close()
-
-def add_xp(user_id: int, amount: int = 1) -> Optional[int]:
-    ensure_user(user_id)
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("UPDATE users SET xp = xp + ? WHERE user_id = ?", (amount, user_id))
-    conn.commit()
-    c.execute("SELECT xp, level FROM users WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    xp, lvl = row["xp"], row["level"]
-    new_level = int((xp ** 0.5))
-    if new_level > lvl:
-        c.execute("UPDATE users SET level = ? WHERE user_id = ?", (new_level, user_id))
-        conn.commit()
-        conn.close()
-        return new_level
-    conn.close()
-    return None
+def write_xp(items) -> list:
+    """Apply buffered (user_id, amount) pairs in one transaction; return (user_id, new_level) level-ups."""
+    level_ups = []
+    with db_cursor() as c:
+        for user_id, amount in items:
+            c.execute("INSERT INTO users(user_id, xp) VALUES (?, ?) "
+                      "ON CONFLICT(user_id) DO UPDATE SET xp = xp + excluded.xp RETURNING xp, level",
+                      (user_id, amount))
+            row = c.fetchone()
+            new_level = isqrt(row["xp"])
+            if new_level > row["level"]:
+                level_ups.append((user_id, new_level))
+        c.executemany("UPDATE users SET level = ? WHERE user_id = ?", [(lvl, uid) for uid, lvl in level_ups])
+    return level_ups
 
 def get_user(user_id: int):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-    row = c.fetchone()
-    conn.close()
-    return row
-
-def change_coins(user_id: int, delta: int) -> int:
-    ensure_user(user_id)
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("UPDATE users SET coins = coins + ? WHERE user_id = ?", (delta, user_id))
-    conn.commit()
-    c.execute("SELECT coins FROM users WHERE user_id = ?", (user_id,))
-    coins = c.fetchone()["coins"]
-    conn.close()
-    return coins
+    with db_cursor() as c:
+        c.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
+        return c.fetchone()
+
+def transfer_coins(src_id: int, dst_id: int, amount: int) -> bool:
+    """Move coins in one transaction; False (nothing changed) if the sender can't cover it."""
+    with db_cursor() as c:
+        c.execute("UPDATE users SET coins = coins - ? WHERE user_id = ? AND coins >= ?", (amount, src_id, amount))
+        if c.rowcount == 0:
+            return False
+        c.execute("INSERT INTO users(user_id, coins) VALUES (?, ?) "
+                  "ON CONFLICT(user_id) DO UPDATE SET coins = coins + excluded.coins",
+                  (dst_id, amount))
+    return True
 
 def log_infraction(guild_id: int, user_id: int, mod_id: int, action: str, reason: str = ""):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO infractions (guild_id, user_id, mod_id, action, reason, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-              (guild_id, user_id, mod_id, action, reason, int(time.time())))
-    conn.commit()
-    conn.close()
+    with db_cursor() as c:
+        c.execute("INSERT INTO infractions (guild_id, user_id, mod_id, action, reason, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                  (guild_id, user_id, mod_id, action, reason, int(time.time())))
 
 def schedule_reminder(user_id:int, guild_id:Optional[int], channel_id:int, remind_at:int, content:str):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO reminders (user_id, guild_id, channel_id, remind_at, content, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-              (user_id, guild_id, channel_id, remind_at, content, int(time.time())))
-    conn.commit()
-    conn.close()
+    with db_cursor() as c:
+        c.execute("INSERT INTO reminders (user_id, guild_id, channel_id, remind_at, content, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                  (user_id, guild_id, channel_id, remind_at, content, int(time.time())))
+
+def get_next_reminder_at() -> Optional[int]:
+    with db_cursor() as c:
+        c.execute("SELECT MIN(remind_at) FROM reminders")
+        return c.fetchone()[0]
+
+def get_due_reminders(now: int):
+    with db_cursor() as c:
+        c.execute("SELECT id, user_id, channel_id, content FROM reminders WHERE remind_at <= ?", (now,))
+        return c.fetchall()
+
+def delete_reminders(reminder_ids):
+    with db_cursor() as c:
+        c.execute(f"DELETE FROM reminders WHERE id IN ({','.join('?' * len(reminder_ids))})", list(reminder_ids))
+
+def set_welcome(guild_id: int, channel_id: int, message: str):
+    with db_cursor() as c:
+        c.execute("INSERT OR REPLACE INTO guild_config (guild_id, welcome_channel, welcome_message) VALUES (?, ?, ?)",
+                  (guild_id, channel_id, message))
+
+def add_reaction_role(guild_id: int, channel_id: int, message_id: int, emoji: str, role_id: int):
+    with db_cursor() as c:
+        c.execute("INSERT OR REPLACE INTO reaction_roles (guild_id, channel_id, message_id, emoji, role_id) VALUES (?, ?, ?, ?, ?)",
+                  (guild_id, channel_id, message_id, emoji, role_id))
+
+def claim_daily(user_id: int, reward: int, now: int) -> bool:
+    """Grant the daily reward in one transaction; False if it was claimed in the last 24h."""
+    with db_cursor() as c:
+        c.execute("INSERT INTO users(user_id) VALUES (?) ON CONFLICT(user_id) DO NOTHING", (user_id,))
+        c.execute("SELECT last_daily FROM users WHERE user_id = ?", (user_id,))
+        last = c.fetchone()["last_daily"] or 0
+        if now - last < 24*3600:
+            return False
+        c.execute("UPDATE users SET coins = coins + ?, last_daily = ? WHERE user_id = ?", (reward, now, user_id))
+    return True
+
+# --------------------
+# XP buffer (flushed periodically instead of a DB write per message)
+# --------------------
+_xp_buffer = defaultdict(int)
+_xp_channels = {}  # user_id -> last channel they earned xp in, for level-up notices
+
+def add_xp(user_id: int, amount: int = 1, channel_id: Optional[int] = None):
+    _xp_buffer[user_id] += amount
+    if channel_id is not None:
+        _xp_channels[user_id] = channel_id
+
+async def flush_xp():
+    if not _xp_buffer:
+        return
+    items = list(_xp_buffer.items())
+    _xp_buffer.clear()
+    try:
+        level_ups = await run_db(write_xp, items)
+    except Exception:
+        logger.exception("XP flush failed")
+        # put the xp back so the next flush retries it (channels are still in _xp_channels)
+        for uid, amount in items:
+            _xp_buffer[uid] += amount
+        return
+    # drop channel entries only for users with no newer xp waiting in the buffer
+    channels = {uid: _xp_channels.get(uid) if uid in _xp_buffer else _xp_channels.pop(uid, None)
+                for uid, _ in items}
+    for uid, lvl in level_ups:
+        ch = bot.get_channel(channels.get(uid))
+        if ch:
+            try:
+                await ch.send(f"🎉 <@{uid}> leveled up to **{lvl}**!")
+            except Exception:
+                pass
+
+@tasks.loop(seconds=XP_FLUSH_SECONDS)
+async def xp_flush_loop():
+    await flush_xp()
+
+@xp_flush_loop.before_loop
+async def _before_xp_flush():
+    await bot.wait_until_ready()
 
 # --------------------
 # HF helpers (chat)
@@ -279,8 +406,8 @@ def query_huggingface_sync(prompt: str) -> Tuple[Optional[str], Optional[str]]:
         return None, str(e)
 
 async def query_huggingface(prompt: str, timeout: int = HF_TIMEOUT_SECONDS) -> Tuple[Optional[str], Optional[str]]:
-    loop = asyncio.get_event_loop()
-    fut = loop.run_in_executor(None, lambda: query_huggingface_sync(prompt))
+    loop = asyncio.get_running_loop()
+    fut = loop.run_in_executor(_hf_pool, query_huggingface_sync, prompt)
     try:
         return await asyncio.wait_for(fut, timeout=timeout)
     except asyncio.TimeoutError:
@@ -292,15 +419,60 @@ async def query_huggingface(prompt: str, timeout: int = HF_TIMEOUT_SECONDS) -> T
 # --------------------
 # Features: commands & handlers
 # --------------------
-@bot.event
-async def on_ready():
-    logger.info("Logged in as %s (id:%s)", bot.user, bot.user.id)
+def _command_signature() -> str:
+    payload = []
+    for cmd in bot.tree.get_commands():
+        try:
+            payload.append(cmd.to_dict(bot.tree))
+        except TypeError:  # discord.py < 2.4
+            payload.append(cmd.to_dict())
+    payload.sort(key=lambda d: d["name"])
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+async def sync_commands_if_changed():
+    # global sync is slow and rate-limited; only do it when the command set changed
+    sig_path = Path(SYNC_HASH_PATH)
+    sig = _command_signature()
+    try:
+        last = sig_path.read_text(encoding="utf-8").strip()
+    except OSError:
+        last = None
+    if sig == last:
+        logger.info("Slash commands unchanged; skipping sync")
+        return
     try:
         synced = await bot.tree.sync()
         logger.info("Synced %d slash commands", len(synced))
+        sig_path.write_text(sig, encoding="utf-8")
     except Exception as e:
         logger.exception("Command sync failed: %s", e)
 
+async def setup_hook():
+    # runs once on the bot's own event loop, before it connects to the gateway
+    await start_heartbeat()
+    xp_flush_loop.start()
+    # created here so it belongs to the running loop; cmd_remindme sets it to wake the worker
+    bot.reminder_wake = asyncio.Event()
+    bot.bg_reminders = asyncio.create_task(reminders_worker())
+    await sync_commands_if_changed()
+
+bot.setup_hook = setup_hook
+
+async def close():
+    # single shutdown path: owner commands, signals and bot.run() teardown all end here
+    xp_flush_loop.stop()  # lets an in-flight flush finish
+    await flush_xp()
+    if getattr(bot, "web_runner", None):
+        await bot.web_runner.cleanup()
+        bot.web_runner = None
+    await commands.Bot.close(bot)
+
+bot.close = close
+
+@bot.event
+async def on_ready():
+    logger.info("Logged in as %s (id:%s)", bot.user, bot.user.id)
+
 # ----- Ask (HF) -----
 @bot.tree.command(name="ask", description="Ask the AI assistant (HF required)")
 @app_commands.describe(question="Your question")
@@ -331,37 +503,34 @@ TRIVIA_QUESTIONS = [
     {"q":"Who wrote Hamlet?","a":"william shakespeare"},
     {"q":"What is 9 * 9?","a":"81"}
 ]
-trivia_scores = {}
-active_trivia = {}
+trivia_scores: Dict[int, int] = {}  # user_id -> points
+active_trivia: Dict[int, Tuple[str, int]] = {}  # channel_id -> (lowercased answer, asker_id)
 
 @bot.tree.command(name="trivia", description="Start a trivia question")
 async def trivia_slash(interaction: discord.Interaction):
     q = random.choice(TRIVIA_QUESTIONS)
-    active_trivia[interaction.channel_id] = (q["a"], interaction.user.id)
+    active_trivia[interaction.channel_id] = (q["a"].lower(), interaction.user.id)
     await interaction.response.send_message(f"🧠 Trivia: {q['q']} (reply in chat)")
 
 @bot.command(name="trivia")
 async def trivia_cmd(ctx):
     q = random.choice(TRIVIA_QUESTIONS)
-    active_trivia[ctx.channel.id] = (q["a"], ctx.author.id)
+    active_trivia[ctx.channel.id] = (q["a"].lower(), ctx.author.id)
     await ctx.send(f"🧠 Trivia: {q['q']} (reply in chat)")
 
 # ----- RPS -----
+RPS_OPTIONS = ("rock","paper","scissors")
+_RPS_WIN = frozenset({("rock","scissors"), ("paper","rock"), ("scissors","paper")})  # (winner, loser)
+
 @bot.tree.command(name="rps", description="Play rock-paper-scissors")
 @app_commands.describe(choice="rock/paper/scissors")
 async def rps_slash(interaction: discord.Interaction, choice: str):
     choice = choice.lower()
-    opts = ["rock","paper","scissors"]
-    if choice not in opts:
+    if choice not in RPS_OPTIONS:
         await interaction.response.send_message("Invalid choice: rock/paper/scissors")
         return
-    bot_choice = random.choice(opts)
-    if choice == bot_choice:
-        res = "Tie!"
-    elif (choice=="rock" and bot_choice=="scissors") or (choice=="paper" and bot_choice=="rock") or (choice=="scissors" and bot_choice=="paper"):
-        res = "You win! 🎉"
-    else:
-        res = "I win! 😈"
+    bot_choice = random.choice(RPS_OPTIONS)
+    res = "Tie!" if choice == bot_choice else ("You win! 🎉" if (choice, bot_choice) in _RPS_WIN else "I win! 😈")
     await interaction.response.send_message(f"You: {choice} | Bot: {bot_choice} — {res}")
 
 @bot.command(name="rps")
@@ -378,7 +547,8 @@ async def poll_slash(interaction: discord.Interaction, question: str, opts: str,
     if len(options) < 2 or len(options) > 5:
         await interaction.response.send_message("Provide 2-5 comma-separated options.")
         return
-    embed = discord.Embed(title=f"📊 {question}", description="\n".join(f"{NUMBER_EMOJIS[i]} {options[i]}" for i in range(len(options))))
+    emojis = NUMBER_EMOJIS[:len(options)]
+    embed = discord.Embed(title=f"📊 {question}", description="\n".join([f"{e} {o}" for e, o in zip(emojis, options)]))
     await interaction.response.send_message(embed=embed)
     # fetch the message object
     try:
@@ -391,12 +561,11 @@ async def poll_slash(interaction: discord.Interaction, question: str, opts: str,
             sent = await interaction.channel.fetch_message((await interaction.original_response()).id)
         except Exception:
             pass
-    for i in range(len(options)):
-        try:
-            await sent.add_reaction(NUMBER_EMOJIS[i])
-            await asyncio.sleep(0.2)
-        except Exception:
-            logger.exception("Failed to add poll reaction")
+    # at most 5 reactions; discord.py's rate limiter handles pacing, so no manual sleeps
+    results = await asyncio.gather(*(sent.add_reaction(e) for e in emojis), return_exceptions=True)
+    for r in results:
+        if isinstance(r, Exception):
+            logger.error("Failed to add poll reaction", exc_info=r)
     await asyncio.sleep(duration)
     try:
         sent = await sent.channel.fetch_message(sent.id)
@@ -404,26 +573,40 @@ async def poll_slash(interaction: discord.Interaction, question: str, opts: str,
         logger.exception("Failed to fetch poll message")
         return
     counts = []
-    for i in range(len(options)):
-        react = discord.utils.get(sent.reactions, emoji=NUMBER_EMOJIS[i])
-        counts.append((options[i], (react.count - 1) if react else 0))
+    for e, o in zip(emojis, options):
+        react = discord.utils.get(sent.reactions, emoji=e)
+        counts.append((o, (react.count - 1) if react else 0))
     await sent.channel.send("🗳️ Poll results:\n" + "\n".join(f"**{o}** — {c} vote(s)" for o,c in counts))
 
 # --------------------
 # Auto-react & Auto-reply configuration (env)
 # --------------------
 AUTO_REACT_CHANNELS = os.environ.get("AUTO_REACT_CHANNELS", "")
-AUTO_REACT_CHANNEL_IDS = [int(x) for x in AUTO_REACT_CHANNELS.split(",") if x.strip().isdigit()]
+AUTO_REACT_CHANNEL_IDS = frozenset(int(x) for x in AUTO_REACT_CHANNELS.split(",") if x.strip().isdigit())
 AUTO_REACT_EMOJIS = [e.strip() for e in os.environ.get("AUTO_REACT_EMOJIS", "👍,🤖,🔥").split(",") if e.strip()]
 AUTO_REACT_KEYWORDS = [k.strip().lower() for k in os.environ.get("AUTO_REACT_KEYWORDS", "").split(",") if k.strip()]
 AUTO_REACT_COOLDOWN = int(os.environ.get("AUTO_REACT_COOLDOWN", "10"))
 
 AUTO_REPLY_CHANNELS = os.environ.get("AUTO_REPLY_CHANNELS", "")
-AUTO_REPLY_CHANNEL_IDS = [int(x) for x in AUTO_REPLY_CHANNELS.split(",") if x.strip().isdigit()]
+AUTO_REPLY_CHANNEL_IDS = frozenset(int(x) for x in AUTO_REPLY_CHANNELS.split(",") if x.strip().isdigit())
 AUTO_REPLY_KEYWORDS = [k.strip().lower() for k in os.environ.get("AUTO_REPLY_KEYWORDS", "").split(",") if k.strip()]
 AUTO_REPLY_CHANCE = int(os.environ.get("AUTO_REPLY_CHANCE", "15"))
 AUTO_REPLY_COOLDOWN = int(os.environ.get("AUTO_REPLY_COOLDOWN", "30"))
 
+def _build_keyword_matcher(keywords):
+    """Return a callable telling whether lowercased text contains any keyword (single pass)."""
+    if ahocorasick:
+        automaton = ahocorasick.Automaton()
+        for kw in keywords:
+            automaton.add_word(kw, kw)
+        automaton.make_automaton()
+        return lambda text: next(automaton.iter(text), None) is not None
+    pattern = re.compile("|".join(map(re.escape, keywords)))
+    return lambda text: pattern.search(text) is not None
+
+_react_keywords_match = _build_keyword_matcher(AUTO_REACT_KEYWORDS) if AUTO_REACT_KEYWORDS else None
+_reply_keywords_match = _build_keyword_matcher(AUTO_REPLY_KEYWORDS) if AUTO_REPLY_KEYWORDS else None
+
 FUN_REPLIES = [
     "Lol true! 😂",
     "That’s epic! 🔥",
@@ -434,8 +617,10 @@ FUN_REPLIES = [
     "Emoji party! 🎉",
 ]
 
-_last_react_time = {}
-_last_reply_time = {}
+# per-(user, channel) cooldown timestamps; bounded, and entries expire well after their cooldown
+COOLDOWN_CACHE_SIZE = 10_000
+_last_react_time = TTLCache(maxsize=COOLDOWN_CACHE_SIZE, ttl=max(AUTO_REACT_COOLDOWN * 4, 1))
+_last_reply_time = TTLCache(maxsize=COOLDOWN_CACHE_SIZE, ttl=max(AUTO_REPLY_COOLDOWN * 4, 1))
 
 async def try_add_reactions(message: discord.Message):
     for emoji in AUTO_REACT_EMOJIS:
@@ -462,24 +647,18 @@ async def try_send_auto_reply(message: discord.Message):
 async def on_message(message: discord.Message):
     if message.author.bot:
         return
+    content_lower = None  # normalised lazily, only when something compares against it
 
-    # award xp
-    try:
-        lvl_up = add_xp(message.author.id, amount=random.randint(1,3))
-        if lvl_up:
-            try:
-                await message.channel.send(f"🎉 {message.author.mention} leveled up to **{lvl_up}**!")
-            except Exception:
-                pass
-    except Exception:
-        logger.exception("XP error")
+    # award xp (buffered; written and announced by xp_flush_loop)
+    add_xp(message.author.id, random.randint(1,3), message.channel.id)
 
     # trivia answer check
     try:
         data = active_trivia.get(message.channel.id)
-        if data:
+        if data is not None:
             answer, _ = data
-            if message.content.strip().lower() == answer:
+            content_lower = message.content.strip().lower()
+            if content_lower == answer:
                 uid = message.author.id
                 trivia_scores[uid] = trivia_scores.get(uid, 0) + 1
                 await message.channel.send(f"✅ {message.author.mention} — Correct! +1 point. Total: {trivia_scores[uid]}")
@@ -493,8 +672,10 @@ async def on_message(message: discord.Message):
     # auto-react
     try:
         if AUTO_REACT_CHANNEL_IDS and message.channel.id in AUTO_REACT_CHANNEL_IDS:
-            if AUTO_REACT_KEYWORDS:
-                if any(kw in message.content.lower() for kw in AUTO_REACT_KEYWORDS):
+            if _react_keywords_match:
+                if content_lower is None:
+                    content_lower = message.content.strip().lower()
+                if _react_keywords_match(content_lower):
                     key = (message.author.id, message.channel.id)
                     if now - _last_react_time.get(key, 0) >= AUTO_REACT_COOLDOWN:
                         _last_react_time[key] = now
@@ -510,7 +691,9 @@ async def on_message(message: discord.Message):
     # auto-reply
     try:
         if AUTO_REPLY_CHANNEL_IDS and message.channel.id in AUTO_REPLY_CHANNEL_IDS:
-            if not AUTO_REPLY_KEYWORDS or any(kw in message.content.lower() for kw in AUTO_REPLY_KEYWORDS):
+            if _reply_keywords_match and content_lower is None:
+                content_lower = message.content.strip().lower()
+            if not _reply_keywords_match or _reply_keywords_match(content_lower):
                 key = (message.author.id, message.channel.id)
                 if now - _last_reply_time.get(key, 0) >= AUTO_REPLY_COOLDOWN:
                     if random.randint(1,100) <= AUTO_REPLY_CHANCE:
@@ -529,7 +712,7 @@ async def on_message(message: discord.Message):
 async def cmd_kick(ctx, member: discord.Member, *, reason: str = "No reason provided"):
     try:
         await member.kick(reason=reason)
-        log_infraction(ctx.guild.id, member.id, ctx.author.id, "kick", reason)
+        await run_db(log_infraction, ctx.guild.id, member.id, ctx.author.id, "kick", reason)
         await ctx.send(f"👢 Kicked {member.mention} — {reason}")
     except Exception as e:
         await ctx.send(f"Kick failed: {e}")
@@ -539,7 +722,7 @@ async def cmd_kick(ctx, member: discord.Member, *, reason: str = "No reason prov
 async def cmd_ban(ctx, member: discord.Member, *, reason: str = "No reason provided"):
     try:
         await member.ban(reason=reason)
-        log_infraction(ctx.guild.id, member.id, ctx.author.id, "ban", reason)
+        await run_db(log_infraction, ctx.guild.id, member.id, ctx.author.id, "ban", reason)
         await ctx.send(f"🔨 Banned {member.mention} — {reason}")
     except Exception as e:
         await ctx.send(f"Ban failed: {e}")
@@ -547,7 +730,7 @@ async def cmd_ban(ctx, member: discord.Member, *, reason: str = "No reason provi
 @bot.command(name="warn")
 @commands.has_permissions(manage_messages=True)
 async def cmd_warn(ctx, member: discord.Member, *, reason: str = "No reason provided"):
-    log_infraction(ctx.guild.id, member.id, ctx.author.id, "warn", reason)
+    await run_db(log_infraction, ctx.guild.id, member.id, ctx.author.id, "warn", reason)
     await ctx.send(f"⚠️ Warned {member.mention} — {reason}")
 
 # --------------------
@@ -556,24 +739,16 @@ async def cmd_warn(ctx, member: discord.Member, *, reason: str = "No reason prov
 @bot.command(name="setwelcome")
 @commands.has_permissions(manage_guild=True)
 async def cmd_setwelcome(ctx, channel: discord.TextChannel, *, message: str = "Welcome {user} to {guild}!"):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO guild_config (guild_id, welcome_channel, welcome_message) VALUES (?, ?, ?)",
-              (ctx.guild.id, channel.id, message))
-    conn.commit(); conn.close()
+    await run_db(set_welcome, ctx.guild.id, channel.id, message)
+    _welcome_cache[ctx.guild.id] = (channel.id, message)
     await ctx.send(f"Welcome set to {channel.mention}")
 
 @bot.event
 async def on_member_join(member: discord.Member):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT welcome_channel, welcome_message FROM guild_config WHERE guild_id = ?", (member.guild.id,))
-    row = c.fetchone()
-    conn.close()
+    row = _welcome_cache.get(member.guild.id)
     if not row:
         return
-    ch_id = row["welcome_channel"]
-    msg = row["welcome_message"]
+    ch_id, msg = row
     channel = member.guild.get_channel(ch_id)
     if channel:
         try:
@@ -584,14 +759,21 @@ async def on_member_join(member: discord.Member):
 # --------------------
 # Reaction roles (setup + raw handlers)
 # --------------------
+async def _get_or_fetch_member(guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+    # guilds aren't chunked at startup, so the member may not be cached yet
+    member = guild.get_member(user_id)
+    if member is None:
+        try:
+            member = await guild.fetch_member(user_id)
+        except Exception:
+            member = None
+    return member
+
 @bot.command(name="createreactionrole")
 @commands.has_permissions(manage_roles=True)
 async def cmd_createreactionrole(ctx, message_id: int, emoji: str, role: discord.Role):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("INSERT INTO reaction_roles (guild_id, channel_id, message_id, emoji, role_id) VALUES (?, ?, ?, ?, ?)",
-              (ctx.guild.id, ctx.channel.id, message_id, emoji, role.id))
-    conn.commit(); conn.close()
+    await run_db(add_reaction_role, ctx.guild.id, ctx.channel.id, message_id, emoji, role.id)
+    _rr_map[(ctx.guild.id, message_id, emoji)] = role.id
     try:
         msg = await ctx.channel.fetch_message(message_id)
         await msg.add_reaction(emoji)
@@ -603,16 +785,13 @@ async def cmd_createreactionrole(ctx, message_id: int, emoji: str, role: discord
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     if payload.user_id == bot.user.id:
         return
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT role_id FROM reaction_roles WHERE guild_id = ? AND message_id = ? AND emoji = ?",
-              (payload.guild_id, payload.message_id, str(payload.emoji)))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        guild = bot.get_guild(payload.guild_id)
-        role = guild.get_role(row["role_id"])
-        member = guild.get_member(payload.user_id)
+    role_id = _rr_map.get((payload.guild_id, payload.message_id, str(payload.emoji)))
+    if role_id is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        role = guild.get_role(role_id)
+        member = payload.member or await _get_or_fetch_member(guild, payload.user_id)
         if member and role:
             try:
                 await member.add_roles(role)
@@ -621,16 +800,13 @@ async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
 
 @bot.event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
-    conn = get_db_conn()
-    c = conn.cursor()
-    c.execute("SELECT role_id FROM reaction_roles WHERE guild_id = ? AND message_id = ? AND emoji = ?",
-              (payload.guild_id, payload.message_id, str(payload.emoji)))
-    row = c.fetchone()
-    conn.close()
-    if row:
-        guild = bot.get_guild(payload.guild_id)
-        role = guild.get_role(row["role_id"])
-        member = guild.get_member(payload.user_id)
+    role_id = _rr_map.get((payload.guild_id, payload.message_id, str(payload.emoji)))
+    if role_id is None:
+        return
+    guild = bot.get_guild(payload.guild_id)
+    if guild:
+        role = guild.get_role(role_id)
+        member = await _get_or_fetch_member(guild, payload.user_id)
         if member and role:
             try:
                 await member.remove_roles(role)
@@ -643,7 +819,7 @@ async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
 @bot.command(name="balance")
 async def cmd_balance(ctx, member: discord.Member = None):
     member = member or ctx.author
-    row = get_user(member.id)
+    row = await run_db(get_user, member.id)
     if not row:
         await ctx.send(f"{member.mention} has 0 coins.")
         return
@@ -654,28 +830,17 @@ async def cmd_give(ctx, member: discord.Member, amount: int):
     if amount <= 0:
         await ctx.send("Enter an amount > 0")
         return
-    row = get_user(ctx.author.id)
-    if row["coins"] < amount:
+    if not await run_db(transfer_coins, ctx.author.id, member.id, amount):
         await ctx.send("Not enough coins.")
         return
-    change_coins(ctx.author.id, -amount)
-    change_coins(member.id, amount)
     await ctx.send(f"{ctx.author.mention} gave {member.mention} **{amount}** coins.")
 
 @bot.command(name="daily")
 async def cmd_daily(ctx):
-    ensure_user(ctx.author.id)
-    row = get_user(ctx.author.id)
-    now = int(time.time())
-    last = row["last_daily"] or 0
-    if now - last < 24*3600:
+    reward = random.randint(50,150)
+    if not await run_db(claim_daily, ctx.author.id, reward, int(time.time())):
         await ctx.send("Daily already claimed. Try later.")
         return
-    reward = random.randint(50,150)
-    change_coins(ctx.author.id, reward)
-    conn = get_db_conn(); c = conn.cursor()
-    c.execute("UPDATE users SET last_daily = ? WHERE user_id = ?", (now, ctx.author.id))
-    conn.commit(); conn.close()
     await ctx.send(f"{ctx.author.mention} claimed daily **{reward}** coins!")
 
 # --------------------
@@ -685,24 +850,36 @@ async def reminders_worker():
     await bot.wait_until_ready()
     while not bot.is_closed():
         try:
-            now = int(time.time())
-            conn = get_db_conn()
-            c = conn.cursor()
-            c.execute("SELECT id, user_id, channel_id, content FROM reminders WHERE remind_at <= ?", (now,))
-            rows = c.fetchall()
+            next_at = await run_db(get_next_reminder_at)
+            delay = None if next_at is None else next_at - time.time()
+            if delay is None or delay > 0:
+                # sleep until the next deadline, or until a (possibly sooner) reminder is scheduled
+                try:
+                    await asyncio.wait_for(bot.reminder_wake.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                bot.reminder_wake.clear()
+                continue
+            rows = await run_db(get_due_reminders, int(time.time()))
+            failed = False
+            fired_ids = []
             for r in rows:
                 try:
                     ch = bot.get_channel(r["channel_id"])
                     if ch:
                         await ch.send(f"<@{r['user_id']}> ⏰ Reminder: {r['content']}")
-                    c.execute("DELETE FROM reminders WHERE id = ?", (r["id"],))
-                    conn.commit()
+                    fired_ids.append(r["id"])
                 except Exception:
+                    failed = True
                     logger.exception("Reminder send failed")
-            conn.close()
+            if fired_ids:
+                await run_db(delete_reminders, fired_ids)
+            if failed:
+                # undelivered reminders stay due; retry later rather than spinning on them
+                await asyncio.sleep(REMINDER_RETRY_SECONDS)
         except Exception:
             logger.exception("Reminder worker error")
-        await asyncio.sleep(10)
+            await asyncio.sleep(REMINDER_RETRY_SECONDS)
 
 @bot.command(name="remindme")
 async def cmd_remindme(ctx, when: str, *, content: str):
@@ -718,12 +895,10 @@ async def cmd_remindme(ctx, when: str, *, content: str):
         await ctx.send("Invalid time format. Use 10m, 2h, 1d, etc.")
         return
     remind_at = int(time.time()) + seconds
-    schedule_reminder(ctx.author.id, ctx.guild.id if ctx.guild else None, ctx.channel.id, remind_at, content)
+    await run_db(schedule_reminder, ctx.author.id, ctx.guild.id if ctx.guild else None, ctx.channel.id, remind_at, content)
+    bot.reminder_wake.set()
     await ctx.send(f"Reminder set for <t:{remind_at}:R>")
 
-# start reminders worker
-bot.loop.create_task(reminders_worker())
-
 # --------------------
 # Image generation stub (HF) - placeholder
 # --------------------
@@ -777,33 +952,42 @@ async def help_cmd(ctx):
     await ctx.send(HELP_TEXT)
 
 # --------------------
-# Flask heartbeat server
+# HTTP heartbeat server (served on the bot's event loop)
 # --------------------
-app = Flask(__name__)
+async def home(request: web.Request) -> web.Response:
+    return web.json_response({"status":"online","bot":"Chatterous"})
 
-@app.route("/")
-def home():
-    return jsonify({"status":"online","bot":"Chatterous"})
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({"status":"healthy","uptime":"running"})
 
-@app.route("/health")
-def health():
-    return jsonify({"status":"healthy","uptime":"running"})
+app = web.Application()
+app.router.add_get("/", home)
+app.router.add_get("/health", health)
 
-def run_flask():
-    port = int(os.environ.get("PORT", DEFAULT_FLASK_PORT))
-    logger.info("Starting Flask on 0.0.0.0:%s", port)
-    app.run(host="0.0.0.0", port=port, threaded=True)
+async def start_heartbeat():
+    port = int(os.environ.get("PORT", DEFAULT_HTTP_PORT))
+    try:
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port).start()
+        bot.web_runner = runner
+        logger.info("Heartbeat server started on 0.0.0.0:%s", port)
+    except Exception:
+        logger.exception("Heartbeat server failed to start")
 
 # --------------------
 # Entrypoint
 # --------------------
 if __name__ == "__main__":
-    # start heartbeat
-    t = threading.Thread(target=run_flask, daemon=True)
-    t.start()
-    logger.info("Flask heartbeat started")
+    # optional faster event loop (install uvloop; not available on Windows)
+    try:
+        import uvloop
+        uvloop.install()
+        logger.info("uvloop event loop installed")
+    except ImportError:
+        pass
 
-    # run bot
+    # run bot (the heartbeat server is started from setup_hook)
     try:
         logger.info("Starting Discord bot...")
         bot.run(DISCORD_TOKEN)